@@ -8,8 +8,12 @@ from .attachment import (
     ImageAttachment, LocationAttachment, SplitAttachment, EmojiAttachment, MentionsAttachment, parse_attachment
 )
 from .bot import Bot, Context
+from .cache import HandlerCache
 from .callback import Callback
+from .circuit_breaker import CircuitBreaker, CircuitOpenError, configure_circuit_breakers
 from .groupme import GroupMe
+from .outbox import Outbox
+from .throttle import Throttle
 
 __version__ = "0.2.12"
 __author__ = "Branden Colen"
@@ -17,12 +21,18 @@ __all__ = [
     "Application",
     "Bot",
     "Callback",
+    "CircuitBreaker",
+    "CircuitOpenError",
     "Context",
     "EmojiAttachment",
+    "HandlerCache",
     "ImageAttachment",
     "LocationAttachment",
     "MentionsAttachment",
+    "Outbox",
     "SplitAttachment",
+    "Throttle",
     "parse_attachment",
+    "configure_circuit_breakers",
     "GroupMe"
 ]
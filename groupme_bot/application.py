@@ -1,12 +1,24 @@
+from __future__ import annotations
+
+import asyncio
 import atexit
-from typing import List, Dict
+import logging
+from typing import TYPE_CHECKING, List, Dict, Optional
 
-from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from starlette.requests import Request
 from starlette.responses import PlainTextResponse, JSONResponse
 from starlette.types import Scope, Receive, Send, ASGIApp
 
 from .bot import Bot
+from .circuit_breaker import circuit_breaker_states
+from .groupme import close_http_client
+from .outbox import Outbox
+from .throttle import Throttle
+
+if TYPE_CHECKING:
+    from apscheduler.schedulers.asyncio import AsyncIOScheduler
+
+logger = logging.getLogger(__name__)
 
 GET = 'GET'
 POST = 'POST'
@@ -22,22 +34,52 @@ class RouteExistsError(Exception):
 
 
 class Application(object):
-    __slots__ = ('_scheduler', '_route_tree')
+    __slots__ = ('_scheduler', '_route_tree', '_bots', '_warm_up', '_warm_up_timeout', '_started', '_outbox',
+                 '_throttle', '_cron_spread', '_cron_semaphore', '_cron_schedules')
     _reserved_routes = ('/', '/_health')
 
-    def __init__(self):
+    def __init__(self, warm_up: bool = True, warm_up_timeout: float = 10.0, outbox: Optional[Outbox] = None,
+                 throttle: Optional[Throttle] = None, cron_spread: float = 0, cron_concurrency: Optional[int] = None):
         """
         The Router is the primary object used to run the GroupMe Bot. Multiple Bots can be handled in one single
         router object. Each bot is assigned an endpoint path and requests to that endpoint will be handled by the
         associated bot.
+
+        The scheduler is started during the ASGI lifespan startup, after which each bot is warmed up (pooled
+        connection opened, group membership prefetched) before the server begins accepting requests.
+        :param warm_up: Whether to warm up the registered bots during startup.
+        :param warm_up_timeout: Maximum number of seconds to spend warming up before startup completes anyway.
+        :param outbox: An Outbox shared by all bots that do not have their own. Its sender runs while the
+            application is running.
+        :param throttle: A Throttle shared by all bots that do not have their own, limiting how often each sender
+            and group can trigger handlers.
+        :param cron_spread: Spread cron jobs sharing an identical schedule over this many seconds. Each of these
+            jobs is delayed by an offset derived from its bot and position, so the offsets are the same on every
+            restart. Jobs whose schedule is not shared with another job are not delayed.
+        :param cron_concurrency: The maximum number of cron jobs allowed to run at the same time.
         """
-        self._scheduler: AsyncIOScheduler = AsyncIOScheduler()
+        self._scheduler: Optional[AsyncIOScheduler] = None
+        self._bots: List[Bot] = []
+        self._warm_up: bool = warm_up
+        self._warm_up_timeout: float = warm_up_timeout
+        self._started: bool = False
+        self._outbox: Optional[Outbox] = outbox
+        self._throttle: Optional[Throttle] = throttle
+        self._cron_spread: float = cron_spread
+        self._cron_semaphore: Optional[asyncio.Semaphore] = None
+        self._cron_schedules: Dict[tuple, List[tuple]] = {}
+        if cron_concurrency is not None:
+            self._cron_semaphore = asyncio.Semaphore(cron_concurrency)
 
         async def _summary(scope: Scope, receive: Receive, send: Send):
             response = JSONResponse({
                 'endpoints': self.endpoints,
                 'jobs': self.jobs,
-                'scheduler_running': self._scheduler.running
+                'scheduler_running': self._scheduler is not None and self._scheduler.running,
+                'circuit_breakers': circuit_breaker_states(),
+                'outbox_pending': await self._outbox_pending(),
+                'bot_stats': {bot.bot_name: bot.stats for bot in self._bots},
+                'handler_caches': {bot.bot_name: bot.cache_stats for bot in self._bots if bot.cache_stats}
             })
             await response(scope, receive, send)
 
@@ -51,6 +93,13 @@ class Application(object):
         }
 
     async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+            return
+        if not self._started:
+            # the server does not support lifespan events, start lazily on the first request instead
+            self._start_background()
+            atexit.register(self._stop_background)
         req = Request(scope, receive, send)
         path = self._route_tree.get(req.url.path)
         if not path:
@@ -62,9 +111,103 @@ class Application(object):
             return
         await handler(scope, receive, send)
 
-    def _start_scheduler(self):
-        atexit.register(lambda: self._scheduler.shutdown(wait=False))
-        self._scheduler.start()
+    async def _lifespan(self, receive: Receive, send: Send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                try:
+                    await self.startup()
+                except Exception as e:
+                    await send({'type': 'lifespan.startup.failed', 'message': str(e)})
+                    return
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                try:
+                    await self.shutdown()
+                except Exception as e:
+                    await send({'type': 'lifespan.shutdown.failed', 'message': str(e)})
+                    return
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def startup(self) -> None:
+        """
+        Starts the scheduler and outbox senders and warms up all registered bots. Called on the ASGI lifespan
+        startup event.
+        """
+        self._start_background()
+        if self._warm_up and self._bots:
+            await self.warm_up()
+
+    async def shutdown(self) -> None:
+        """
+        Stops the scheduler and outbox senders and closes pooled connections. Called on the ASGI lifespan shutdown
+        event.
+        """
+        self._stop_scheduler()
+        for outbox in self.outboxes:
+            await outbox.stop()
+        close_http_client()
+
+    async def warm_up(self) -> None:
+        """
+        Warms up every registered bot concurrently. Failures and timeouts are logged rather than raised so that a
+        slow or unavailable GroupMe API does not prevent the application from starting.
+        """
+        loop = asyncio.get_running_loop()
+        tasks = [loop.run_in_executor(None, bot.warm_up) for bot in self._bots]
+        try:
+            results = await asyncio.wait_for(asyncio.gather(*tasks, return_exceptions=True), self._warm_up_timeout)
+        except asyncio.TimeoutError:
+            logger.warning('bot warm up did not finish within %s seconds', self._warm_up_timeout)
+            return
+        for bot, result in zip(self._bots, results):
+            if isinstance(result, Exception):
+                logger.warning('failed to warm up bot `%s`: %s', bot.bot_name, result)
+
+    def _start_background(self):
+        """
+        Starts the scheduler and the sender of every outbox that is not running yet. Must be called on the event loop.
+        """
+        self._started = True
+        if self._scheduler is not None and not self._scheduler.running:
+            self._scheduler.start()
+        for outbox in self.outboxes:
+            outbox.start()
+
+    def _stop_background(self):
+        """
+        Stops the scheduler and flushes and closes every outbox without the event loop, for use at interpreter exit.
+        """
+        self._stop_scheduler()
+        for outbox in self.outboxes:
+            outbox.close()
+
+    def _stop_scheduler(self):
+        if self._scheduler is not None and self._scheduler.running:
+            self._scheduler.shutdown(wait=False)
+
+    def _add_spread_job(self, func, job: dict, offset_key: str) -> None:
+        from apscheduler.triggers.cron import CronTrigger
+        from .cron import OffsetTrigger, split_cron_kwargs, stagger_offset
+
+        trigger_kwargs, options = split_cron_kwargs(job['kwargs'])
+        trigger_kwargs.setdefault('timezone', self.scheduler.timezone)
+        schedule = tuple(sorted((key, str(value)) for key, value in trigger_kwargs.items()))
+        jobs = self._cron_schedules.setdefault(schedule, [])
+
+        trigger = CronTrigger(**trigger_kwargs)
+        if jobs:
+            trigger = OffsetTrigger(trigger, stagger_offset(offset_key, self._cron_spread))
+        scheduled = self.scheduler.add_job(func, trigger, args=job['args'], **options)
+        jobs.append((scheduled.id, trigger, offset_key))
+
+        if len(jobs) == 2:
+            # the first job with this schedule was added without an offset while it was the only one
+            job_id, first_trigger, first_key = jobs[0]
+            first_trigger = OffsetTrigger(first_trigger, stagger_offset(first_key, self._cron_spread))
+            self.scheduler.reschedule_job(job_id, trigger=first_trigger)
+            jobs[0] = (job_id, first_trigger, first_key)
 
     @property
     def routes(self) -> Dict[str, Dict[str, ASGIApp]]:
@@ -77,11 +220,48 @@ class Application(object):
     @property
     def scheduler(self) -> AsyncIOScheduler:
         """
-        The AsyncIOScheduler object being used for cron jobs
+        The AsyncIOScheduler object being used for cron jobs. APScheduler is only imported once this is first needed.
         :return AsyncIOScheduler:
         """
+        if self._scheduler is None:
+            from apscheduler.schedulers.asyncio import AsyncIOScheduler
+            self._scheduler = AsyncIOScheduler()
         return self._scheduler
 
+    async def _outbox_pending(self) -> Dict[str, int]:
+        loop = asyncio.get_running_loop()
+        pending = {}
+        for outbox in self.outboxes:
+            # counting waits on the outbox database thread, keep it off the event loop
+            pending[str(outbox.path)] = await loop.run_in_executor(None, lambda o=outbox: o.pending)
+        return pending
+
+    @property
+    def outboxes(self) -> List[Outbox]:
+        """
+        All outboxes used by the registered bots
+        :return List[Outbox]:
+        """
+        outboxes = [] if self._outbox is None else [self._outbox]
+        for bot in self._bots:
+            if bot.outbox is not None and bot.outbox not in outboxes:
+                outboxes.append(bot.outbox)
+        return outboxes
+
+    def cron_firing_distribution(self, horizon: float = 3600, resolution: float = 1.0) -> Dict[str, int]:
+        """
+        A report of when the scheduled cron jobs will fire over the next `horizon` seconds
+        :param horizon: The length of the report in seconds
+        :param resolution: The size of each time slot in seconds
+        :return dict: key=the ISO formatted start of the slot, value=the number of jobs firing in it
+        """
+        if self._scheduler is None:
+            return {}
+        from datetime import datetime
+        from .cron import firing_distribution
+        start = datetime.now(self._scheduler.timezone)
+        return firing_distribution((job.trigger for job in self._scheduler.get_jobs()), start, horizon, resolution)
+
     @property
     def endpoints(self) -> Dict[str, Dict[str, str]]:
         """
@@ -104,6 +284,8 @@ class Application(object):
         :return List[str]: A list of the string repr of each running job
         """
         job_summary = []
+        if self._scheduler is None:
+            return job_summary
         jobs = self._scheduler.get_jobs()
         if jobs:
             for job in jobs:
@@ -128,14 +310,27 @@ class Application(object):
 
         # store the bot for call routing
         self._route_tree[callback_path] = {POST: bot, GET: _ping_handler, HEAD: _ping_handler}
+        if bot not in self._bots:
+            self._bots.append(bot)
+        if bot.outbox is None:
+            bot.outbox = self._outbox
+        if bot.throttle is None:
+            bot.throttle = self._throttle
 
-        # add any scheduler jobs
-        for job in bot.cron_jobs:
-            self._scheduler.add_job(
-                job['func'],
+        # add any scheduler jobs, these are started along with the scheduler on application startup
+        for i, job in enumerate(bot.cron_jobs):
+            func = job['func']
+            if self._cron_semaphore is not None:
+                from .cron import limit_concurrency
+                func = limit_concurrency(func, self._cron_semaphore)
+            if self._cron_spread:
+                self._add_spread_job(func, job, f"{bot.bot_id}:{bot.bot_name}:{i}")
+                continue
+            self.scheduler.add_job(
+                func,
                 job['trigger'],
                 args=job['args'],
                 **job['kwargs']
             )
-            if not self._scheduler.running:
-                self._start_scheduler()
+        if self._started:
+            self._start_background()
@@ -1,18 +1,25 @@
 from __future__ import annotations
 
+import asyncio
 import re
+import time
 from collections import OrderedDict
 from json.decoder import JSONDecodeError
-from typing import Any, List, Callable, Optional
+from typing import TYPE_CHECKING, Any, Dict, List, Callable, Optional, Pattern, Tuple, Union
 
-import httpx
 from starlette.requests import Request
 from starlette.responses import PlainTextResponse
 from starlette.types import Scope, Receive, Send
 
 from .attachment import Attachment, MentionsAttachment
+from .cache import HandlerCache
 from .callback import Callback
-from .groupme import GroupMe
+from .groupme import GroupMe, api_request
+from .outbox import Outbox
+from .throttle import Throttle
+
+if TYPE_CHECKING:
+    import httpx
 
 _success_response = PlainTextResponse('Success')
 
@@ -21,6 +28,10 @@ class HandlerPatternExistsError(Exception):
     pass
 
 
+class OutboxNotConfiguredError(Exception):
+    pass
+
+
 class Context(object):
     __slots__ = ('_bot', '_callback')
 
@@ -44,9 +55,13 @@ class Context(object):
 
 
 class Bot(GroupMe):
-    __slots__ = ('bot_name', 'bot_id', 'groupme_api_token', 'group_id', '_handler_functions', '_jobs')
+    __slots__ = ('bot_name', 'bot_id', 'groupme_api_token', 'group_id', '_handler_functions', '_handler_patterns',
+                 '_jobs', '_group', '_group_fetched_at', 'outbox', 'throttle', '_handler_cooldowns',
+                 '_handler_last_run', '_handler_caches', '_stats')
+    group_cache_ttl = 300
 
-    def __init__(self, bot_name: str, bot_id: str, groupme_api_token: str, group_id: str):
+    def __init__(self, bot_name: str, bot_id: str, groupme_api_token: str, group_id: str,
+                 outbox: Optional[Outbox] = None, throttle: Optional[Throttle] = None):
         """
         The Bot class represents a single bot that can contains multiple callback handlers and scheduled jobs.
         Bots are run using the Router class.
@@ -55,6 +70,9 @@ class Bot(GroupMe):
         :param bot_id: The Bot ID provided by GroupMe.
         :param groupme_api_token: The GroupMe API token for access to group details.
         :param group_id: The id of the GroupMe group in which the bot exists.
+        :param outbox: The Outbox used by `enqueue_message`. Defaults to the outbox of the Application, if any.
+        :param throttle: The Throttle limiting how often senders can trigger handlers. Defaults to the throttle of
+            the Application, if any.
         """
         super().__init__(groupme_api_token)
         self.bot_name = bot_name
@@ -63,7 +81,16 @@ class Bot(GroupMe):
         self.group_id = group_id
 
         self._handler_functions: OrderedDict = OrderedDict()
+        self._handler_patterns: OrderedDict[str, Pattern] = OrderedDict()
         self._jobs = []
+        self._group: Optional[dict] = None
+        self._group_fetched_at: float = 0.0
+        self.outbox: Optional[Outbox] = outbox
+        self.throttle: Optional[Throttle] = throttle
+        self._handler_cooldowns: Dict[str, float] = {}
+        self._handler_last_run: Dict[str, float] = {}
+        self._handler_caches: Dict[str, HandlerCache] = {}
+        self._stats: Dict[str, int] = {'throttled': 0, 'cooldown': 0}
 
     @property
     def cron_jobs(self) -> List[dict]:
@@ -73,6 +100,23 @@ class Bot(GroupMe):
         """
         return self._jobs
 
+    @property
+    def stats(self) -> Dict[str, int]:
+        """
+        Counts of callbacks that matched a handler but were not run, either because the sender or group was
+        throttled or because the handler was cooling down.
+        :return dict:
+        """
+        return dict(self._stats)
+
+    @property
+    def cache_stats(self) -> Dict[str, Dict[str, int]]:
+        """
+        The stats of each handler cache
+        :return dict: key=the handler regex pattern, value=the cache stats
+        """
+        return {pattern: cache.stats for pattern, cache in self._handler_caches.items()}
+
     def __str__(self):
         return f"{self.bot_name}: {len(self._handler_functions)} callback handlers, " \
                f"{len(self._jobs)} cron jobs at {hex(id(self))}"
@@ -92,9 +136,16 @@ class Bot(GroupMe):
             return
         text = callback.text.lower().strip()
         for pattern, func in self._handler_functions.items():
-            if re.search(pattern, text):
+            if self._handler_patterns[pattern].search(text):
+                if not self._admit(pattern, callback):
+                    await _success_response(scope, receive, send)
+                    return
                 try:
-                    func(Context(self, callback))
+                    cache = self._handler_caches.get(pattern)
+                    if cache is None:
+                        func(Context(self, callback))
+                    else:
+                        await self._reply(await cache.get(Context(self, callback), func))
                     await _success_response(scope, receive, send)
                     return
                 except Exception as e:
@@ -104,16 +155,53 @@ class Bot(GroupMe):
         await _success_response(scope, receive, send)
         return
 
-    def add_callback_handler(self, regex_pattern: str, func: Callable[[Context], Any]) -> None:
+    def _admit(self, pattern: str, callback: Callback) -> bool:
+        now = time.monotonic()
+        cooldown = self._handler_cooldowns.get(pattern)
+        if cooldown:
+            last_run = self._handler_last_run.get(pattern)
+            if last_run is not None and now - last_run < cooldown:
+                self._stats['cooldown'] += 1
+                return False
+        if self.throttle is not None and not self.throttle.admit(callback.sender_id, callback.group_id):
+            self._stats['throttled'] += 1
+            return False
+        if cooldown:
+            self._handler_last_run[pattern] = now
+        return True
+
+    async def _reply(self, reply: Union[None, str, Tuple[str, List[Attachment]]]) -> None:
+        if reply is None:
+            return
+        msg, attachments = (reply, None) if isinstance(reply, str) else reply
+        if self.outbox is not None:
+            self.enqueue_message(msg, attachments)
+            return
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self.post_message, msg, attachments)
+
+    def add_callback_handler(self, regex_pattern: str, func: Callable[[Context], Any],
+                             cooldown: Optional[float] = None, cache: Optional[HandlerCache] = None) -> None:
         """
         Registers a regex pattern as to a bot handler function. If the regex pattern
         is found in a message from a GroupMe user, the function will be called.
         :param regex_pattern: The pattern to search for in the message text
         :param Callable[[Context], Any] func: The function to be called when the pattern is matched
+        :param Optional[float] cooldown: Minimum number of seconds between two calls of the handler. Matching
+            messages received during the cooldown are ignored.
+        :param Optional[HandlerCache] cache: Caches the handler's reply. The handler must then be idempotent and,
+            instead of posting, return its reply as a message string, a (message, attachments) tuple or None. The
+            bot posts the returned reply, which is reused for identical messages while it is cached. Replies are
+            posted in the default executor, or enqueued if the bot has an outbox.
         """
         if regex_pattern in self._handler_functions:
             raise HandlerPatternExistsError(f"The pattern `{regex_pattern}` is already registered to a handler")
+        self._handler_patterns[regex_pattern] = re.compile(regex_pattern)
         self._handler_functions[regex_pattern] = func
+        if cooldown:
+            self._handler_cooldowns[regex_pattern] = cooldown
+        if cache is not None:
+            self._handler_caches[regex_pattern] = cache
 
     def add_cron_job(self, func: Callable[[Context], Any], **kwargs) -> None:
         """
@@ -150,22 +238,58 @@ class Bot(GroupMe):
         :param Optional[List[Attachment]] attachments: Attachments to send in the message
         :return requests.Response: The POST request response object
         """
+        response = api_request(
+            'bots/post',
+            'POST',
+            'https://api.groupme.com/v3/bots/post',
+            json=self._message_payload(msg, attachments),
+            headers={'Content-Type': 'application/json'}
+        )
+        response.raise_for_status()
+        return response
+
+    def enqueue_message(self, msg: str, attachments: Optional[List[Attachment]] = None) -> str:
+        """
+        Adds a bot message to the outbox and returns immediately. The message is posted to the group in the
+        background, in order with the other enqueued messages of this bot, and is retried until GroupMe accepts it.
+        :param str msg: The message to be sent
+        :param Optional[List[Attachment]] attachments: Attachments to send in the message
+        :return str: A ticket that can be passed to `Outbox.is_pending`
+        """
+        if self.outbox is None:
+            raise OutboxNotConfiguredError(f"Bot `{self.bot_name}` has no outbox to enqueue messages to")
+        return self.outbox.enqueue(self.bot_id, self._message_payload(msg, attachments))
+
+    def _message_payload(self, msg: str, attachments: Optional[List[Attachment]]) -> dict:
         if attachments:
             attachments = [attachment.to_dict() for attachment in attachments]
         else:
             attachments = []
-        data = {
+        return {
             "bot_id": self.bot_id,
             "text": msg,
             "attachments": attachments
         }
-        response = httpx.post(
-            'https://api.groupme.com/v3/bots/post',
-            json=data,
-            headers={'Content-Type': 'application/json'}
-        )
-        response.raise_for_status()
-        return response
+
+    def group(self, max_age: Optional[float] = None) -> dict:
+        """
+        The bot's group summary, reusing a previously fetched copy if it is younger than `max_age` seconds.
+        :param Optional[float] max_age: Maximum age of a cached group in seconds, defaults to `group_cache_ttl`
+        :return dict:
+        """
+        if max_age is None:
+            max_age = self.group_cache_ttl
+        if self._group is None or time.monotonic() - self._group_fetched_at > max_age:
+            self._group = self.get_group(self.group_id)
+            self._group_fetched_at = time.monotonic()
+        return self._group
+
+    def warm_up(self) -> None:
+        """
+        Prepares the bot to serve its first callback quickly by opening a pooled connection to the GroupMe API
+        and prefetching the group membership.
+        """
+        self.group(max_age=0)
 
     def mention_all(self) -> None:
         """
@@ -174,7 +298,7 @@ class Bot(GroupMe):
         text = ''
         user_ids = []
         loci = []
-        group = self.get_group(self.group_id)
+        group = self.group()
         for member in group['members']:
             user_ids.append(member['user_id'])
             loci.append([len(text), len(member['nickname']) + 1])
@@ -0,0 +1,115 @@
+from __future__ import annotations
+
+import asyncio
+import inspect
+import time
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Any, Callable, Dict, Hashable, Optional, Tuple
+
+if TYPE_CHECKING:
+    from .bot import Context
+
+
+def normalize_text(text: Optional[str]) -> str:
+    """
+    Normalizes message text for use in a cache key by lower casing it and collapsing whitespace
+    :param Optional[str] text: The message text
+    :return str:
+    """
+    return ' '.join((text or '').lower().split())
+
+
+class HandlerCache(object):
+    __slots__ = ('ttl', 'maxsize', 'key', '_entries', '_inflight', '_stats')
+
+    def __init__(self, ttl: float = 300, maxsize: int = 1024, key: Optional[Callable[[Context], Hashable]] = None):
+        """
+        Caches the replies of an idempotent callback handler. Replies are cached by the normalized message text,
+        plus the result of the `key` function if one is given. Concurrent callbacks with the same key share a single
+        call of the handler.
+        :param ttl: Seconds a cached reply stays valid
+        :param maxsize: The maximum number of cached replies, the least recently used reply is evicted first
+        :param key: An optional function of the Context whose result is added to the cache key
+        """
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.key = key
+        self._entries: OrderedDict[Tuple[str, Hashable], Tuple[float, Any]] = OrderedDict()
+        self._inflight: Dict[Tuple[str, Hashable], asyncio.Future] = {}
+        self._stats: Dict[str, int] = {'hits': 0, 'misses': 0, 'collapsed': 0, 'evictions': 0}
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        """
+        Counts of cache hits, misses, callbacks that waited on an identical in flight call, and evictions
+        :return dict:
+        """
+        return {**self._stats, 'size': len(self._entries)}
+
+    def cache_key(self, ctx: Context) -> Tuple[str, Hashable]:
+        """
+        The cache key for a callback
+        :param Context ctx:
+        :return tuple:
+        """
+        return normalize_text(ctx.callback.text), self.key(ctx) if self.key is not None else None
+
+    def clear(self) -> None:
+        """
+        Removes all cached replies
+        """
+        self._entries.clear()
+
+    async def get(self, ctx: Context, func: Callable[[Context], Any]) -> Any:
+        """
+        Returns the cached reply for the callback, calling the handler if there is none. Synchronous handlers are
+        called in the default executor.
+        :param Context ctx: The handler context
+        :param func: The handler
+        :return: The handler's reply
+        """
+        key = self.cache_key(ctx)
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, value = entry
+            if expires_at > time.monotonic():
+                self._entries.move_to_end(key)
+                self._stats['hits'] += 1
+                return value
+            del self._entries[key]
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self._stats['collapsed'] += 1
+            return await asyncio.shield(inflight)
+
+        self._stats['misses'] += 1
+        loop = asyncio.get_running_loop()
+        future = self._inflight[key] = loop.create_future()
+        try:
+            if inspect.iscoroutinefunction(func):
+                value = await func(ctx)
+            else:
+                value = await loop.run_in_executor(None, func, ctx)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception()  # waiters still receive the exception, but it is not reported as unretrieved
+            raise
+        finally:
+            del self._inflight[key]
+        future.set_result(value)
+        self._put(key, value)
+        return value
+
+    def _put(self, key: Tuple[str, Hashable], value: Any) -> None:
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self._stats['evictions'] += 1
@@ -0,0 +1,201 @@
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, Optional, Union
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class CircuitBreaker(object):
+    __slots__ = ('name', 'failure_rate', 'window', 'min_calls', 'reset_timeout', 'half_open_probes',
+                 '_lock', '_state', '_generation', '_outcomes', '_opened_at', '_probes_in_flight',
+                 '_probe_successes')
+
+    def __init__(self, name: str, failure_rate: float = 0.5, window: int = 20, min_calls: int = 5,
+                 reset_timeout: float = 30.0, half_open_probes: int = 3):
+        """
+        Tracks the outcome of recent calls to a single GroupMe API endpoint. Once the failure rate over the last
+        `window` calls reaches `failure_rate` the circuit opens and calls fail fast with a CircuitOpenError. After
+        `reset_timeout` seconds the circuit becomes half open and lets up to `half_open_probes` calls through. If all
+        of them succeed the circuit closes again, if any of them fails it opens again.
+
+        Every state change starts a new generation. `before_call` returns the generation a call was admitted in and
+        outcomes recorded for an earlier generation are ignored, so a slow call admitted while the circuit was closed
+        cannot be mistaken for a probe.
+        :param name: The name of the endpoint being protected
+        :param failure_rate: The fraction of failed calls (0-1) in the window at which the circuit opens
+        :param window: The number of most recent calls used to compute the failure rate
+        :param min_calls: The minimum number of calls in the window before the circuit can open
+        :param reset_timeout: Seconds to wait while open before probing the endpoint again
+        :param half_open_probes: The number of probe calls allowed through while half open
+        """
+        self.name = name
+        self.failure_rate = failure_rate
+        self.window = window
+        self.min_calls = min_calls
+        self.reset_timeout = reset_timeout
+        self.half_open_probes = half_open_probes
+
+        self._lock = threading.Lock()
+        self._state: str = CLOSED
+        self._generation: int = 0
+        self._outcomes: Deque[bool] = deque(maxlen=window)
+        self._opened_at: float = 0.0
+        self._probes_in_flight: int = 0
+        self._probe_successes: int = 0
+
+    @property
+    def state(self) -> str:
+        """
+        The current state of the circuit, one of `closed`, `open` or `half_open`
+        :return str:
+        """
+        with self._lock:
+            self._check_reset_timeout()
+            return self._state
+
+    @property
+    def current_failure_rate(self) -> float:
+        """
+        The fraction of failed calls among the calls in the window
+        :return float:
+        """
+        with self._lock:
+            if not self._outcomes:
+                return 0.0
+            return self._outcomes.count(False) / len(self._outcomes)
+
+    def before_call(self) -> int:
+        """
+        Must be called before each request to the endpoint. Raises a CircuitOpenError if the call should not be made.
+        The outcome of the call must then be recorded with `record_success` or `record_failure`.
+        :return int: The generation the call was admitted in, to pass when recording its outcome
+        """
+        with self._lock:
+            self._check_reset_timeout()
+            if self._state == OPEN:
+                retry_in = self.reset_timeout - (time.monotonic() - self._opened_at)
+                raise CircuitOpenError(f"Circuit for `{self.name}` is open, retry in {max(retry_in, 0):.1f} seconds")
+            if self._state == HALF_OPEN:
+                if self._probes_in_flight + self._probe_successes >= self.half_open_probes:
+                    raise CircuitOpenError(f"Circuit for `{self.name}` is half open and waiting on probe requests")
+                self._probes_in_flight += 1
+            return self._generation
+
+    def record_success(self, generation: Optional[int] = None) -> None:
+        """
+        Records a successful call to the endpoint
+        :param Optional[int] generation: The generation returned by `before_call`, defaults to the current one
+        """
+        with self._lock:
+            if not self._is_current(generation):
+                return
+            if self._state == HALF_OPEN:
+                self._probes_in_flight -= 1
+                self._probe_successes += 1
+                if self._probe_successes >= self.half_open_probes:
+                    self._close()
+                return
+            self._outcomes.append(True)
+
+    def record_failure(self, generation: Optional[int] = None) -> None:
+        """
+        Records a failed call to the endpoint, possibly opening the circuit
+        :param Optional[int] generation: The generation returned by `before_call`, defaults to the current one
+        """
+        with self._lock:
+            if not self._is_current(generation):
+                return
+            if self._state == HALF_OPEN:
+                self._open()
+                return
+            self._outcomes.append(False)
+            if self._state == CLOSED and len(self._outcomes) >= self.min_calls:
+                if self._outcomes.count(False) / len(self._outcomes) >= self.failure_rate:
+                    self._open()
+
+    def reset(self) -> None:
+        """
+        Closes the circuit and forgets all recorded calls
+        """
+        with self._lock:
+            self._close()
+
+    def to_dict(self) -> Dict[str, Union[str, float, int]]:
+        """
+        A summary of the circuit state
+        :return dict:
+        """
+        return {
+            'state': self.state,
+            'failure_rate': round(self.current_failure_rate, 3),
+            'calls': len(self._outcomes),
+        }
+
+    def _is_current(self, generation: Optional[int]) -> bool:
+        self._check_reset_timeout()
+        return generation is None or generation == self._generation
+
+    def _check_reset_timeout(self) -> None:
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+            self._state = HALF_OPEN
+            self._generation += 1
+            self._probes_in_flight = 0
+            self._probe_successes = 0
+
+    def _open(self) -> None:
+        self._state = OPEN
+        self._generation += 1
+        self._opened_at = time.monotonic()
+
+    def _close(self) -> None:
+        self._state = CLOSED
+        self._generation += 1
+        self._outcomes.clear()
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+_breaker_options: dict = {}
+
+
+def configure_circuit_breakers(**options) -> None:
+    """
+    Sets the options used by every GroupMe API circuit breaker. Accepts the keyword arguments of CircuitBreaker
+    (`failure_rate`, `window`, `min_calls`, `reset_timeout`, `half_open_probes`). Existing breakers are reset.
+    """
+    with _breakers_lock:
+        _breaker_options.clear()
+        _breaker_options.update(options)
+        _breakers.clear()
+
+
+def get_circuit_breaker(endpoint: str) -> CircuitBreaker:
+    """
+    The circuit breaker for a GroupMe API endpoint, shared by all bots
+    :param str endpoint: The endpoint name, such as `bots/post`
+    :return CircuitBreaker:
+    """
+    breaker: Optional[CircuitBreaker] = _breakers.get(endpoint)
+    if breaker is None:
+        with _breakers_lock:
+            breaker = _breakers.get(endpoint)
+            if breaker is None:
+                breaker = _breakers[endpoint] = CircuitBreaker(endpoint, **_breaker_options)
+    return breaker
+
+
+def circuit_breaker_states() -> Dict[str, dict]:
+    """
+    A summary of every circuit breaker in use
+    :return dict: key=the endpoint name, value=the circuit summary
+    """
+    return {endpoint: breaker.to_dict() for endpoint, breaker in list(_breakers.items())}
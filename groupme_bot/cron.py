@@ -0,0 +1,109 @@
+import asyncio
+import functools
+import hashlib
+import inspect
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Iterable, Tuple
+
+from apscheduler.triggers.base import BaseTrigger
+
+CRON_TRIGGER_FIELDS = ('year', 'month', 'day', 'week', 'day_of_week', 'hour', 'minute', 'second', 'start_date',
+                       'end_date', 'timezone', 'jitter')
+
+
+def split_cron_kwargs(kwargs: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """
+    Splits the keyword arguments of `Bot.add_cron_job` into CronTrigger fields and `add_job` options, such as
+    `misfire_grace_time` or `max_instances`.
+    :param dict kwargs: The cron job keyword arguments
+    :return tuple: The CronTrigger fields and the job options
+    """
+    trigger_kwargs = {key: value for key, value in kwargs.items() if key in CRON_TRIGGER_FIELDS}
+    options = {key: value for key, value in kwargs.items() if key not in CRON_TRIGGER_FIELDS}
+    return trigger_kwargs, options
+
+
+class OffsetTrigger(BaseTrigger):
+    __slots__ = ('trigger', 'offset')
+
+    def __init__(self, trigger: BaseTrigger, offset: float):
+        """
+        Fires `offset` seconds after every fire time of the wrapped trigger.
+        :param trigger: The trigger to offset
+        :param offset: The number of seconds to delay each fire time by
+        """
+        self.trigger = trigger
+        self.offset = offset
+
+    def get_next_fire_time(self, previous_fire_time, now):
+        delta = timedelta(seconds=self.offset)
+        if previous_fire_time is not None:
+            previous_fire_time -= delta
+        next_fire_time = self.trigger.get_next_fire_time(previous_fire_time, now - delta)
+        if next_fire_time is None:
+            return None
+        return next_fire_time + delta
+
+    def __str__(self):
+        return f'{self.trigger} offset {self.offset:.3f}s'
+
+    def __repr__(self):
+        return f'<OffsetTrigger ({self.trigger!r}, offset={self.offset!r})>'
+
+
+def stagger_offset(key: str, window: float) -> float:
+    """
+    A deterministic offset for the key, uniformly spread over the window. The same key always gets the same offset,
+    across processes and restarts.
+    :param str key: A key identifying the job, such as the bot and job index
+    :param float window: The size of the window in seconds
+    :return float: The offset in seconds, between 0 and `window`
+    """
+    digest = hashlib.sha1(key.encode()).digest()
+    return int.from_bytes(digest[:8], 'big') / 2 ** 64 * window
+
+
+def limit_concurrency(func: Callable[..., Any], semaphore: asyncio.Semaphore) -> Callable[..., Any]:
+    """
+    Wraps a job function so it only runs while holding the semaphore. Synchronous functions are run in the default
+    executor.
+    :param func: The job function
+    :param semaphore: The semaphore shared by all jobs whose concurrency is limited together
+    :return: A coroutine function to schedule in place of `func`
+    """
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        async with semaphore:
+            if inspect.iscoroutinefunction(func):
+                return await func(*args, **kwargs)
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(None, functools.partial(func, *args, **kwargs))
+    return wrapper
+
+
+def firing_distribution(triggers: Iterable[BaseTrigger], start: datetime, horizon: float,
+                        resolution: float = 1.0) -> Dict[str, int]:
+    """
+    Counts how many times the triggers fire within each `resolution` second slot between `start` and `start` plus
+    `horizon` seconds. Slots are aligned to multiples of `resolution` seconds since the epoch, so with the default
+    resolution they line up with wall clock seconds. Slots in which nothing fires are left out.
+    :param triggers: The job triggers
+    :param start: The timezone aware start of the report
+    :param horizon: The length of the report in seconds
+    :param resolution: The size of each slot in seconds
+    :return dict: key=the ISO formatted start of the slot, value=the number of jobs firing in it, ordered by time
+    """
+    end = start + timedelta(seconds=horizon)
+    timestamp = start.timestamp()
+    slot_start = datetime.fromtimestamp(timestamp - timestamp % resolution, start.tzinfo)
+    slots: Dict[datetime, int] = {}
+    for trigger in triggers:
+        previous = None
+        fire_time = trigger.get_next_fire_time(previous, start)
+        while fire_time is not None and fire_time < end:
+            slot = slot_start + timedelta(seconds=(fire_time - slot_start).total_seconds() // resolution * resolution)
+            slots[slot] = slots.get(slot, 0) + 1
+            previous = fire_time
+            fire_time = trigger.get_next_fire_time(previous, fire_time + timedelta(microseconds=1))
+    return OrderedDict((slot.isoformat(), slots[slot]) for slot in sorted(slots))
@@ -1,4 +1,10 @@
-import httpx
+import threading
+from typing import TYPE_CHECKING, Optional
+
+from .circuit_breaker import get_circuit_breaker
+
+if TYPE_CHECKING:
+    import httpx
 
 _status_codes = {
     200: "Success!",
@@ -24,6 +30,61 @@ class GroupMeException(Exception):
     pass
 
 
+_client: Optional['httpx.Client'] = None
+_client_lock = threading.Lock()
+
+
+def http_client() -> 'httpx.Client':
+    """
+    The pooled HTTP client shared by every GroupMe object. httpx is imported and the client is created on first use
+    so that importing the package stays cheap.
+    :return httpx.Client:
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                import httpx
+                _client = httpx.Client()
+    return _client
+
+
+def close_http_client() -> None:
+    """
+    Close the shared HTTP client and its pooled connections. A new client is created on the next request.
+    """
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+            _client = None
+
+
+def api_request(endpoint: str, method: str, url: str, **kwargs) -> 'httpx.Response':
+    """
+    Send a request to the GroupMe API through the circuit breaker for the given endpoint. Errors raised while sending
+    the request and 5xx responses count as failures. Raises CircuitOpenError without sending the request while the
+    circuit is open.
+    :param str endpoint: The endpoint name used to select the circuit breaker, such as `bots/post`
+    :param str method: The HTTP method
+    :param str url: The full request URL
+    :return httpx.Response:
+    """
+    breaker = get_circuit_breaker(endpoint)
+    generation = breaker.before_call()
+    try:
+        response = http_client().request(method, url, **kwargs)
+    except BaseException:
+        # any error must be recorded, otherwise a half open circuit keeps waiting on the probe
+        breaker.record_failure(generation)
+        raise
+    if response.status_code >= 500:
+        breaker.record_failure(generation)
+    else:
+        breaker.record_success(generation)
+    return response
+
+
 class GroupMe(object):
     __slots__ = 'groupme_api_token'
 
@@ -36,31 +97,35 @@ class GroupMe(object):
         :param str image_url: The URL for any image
         :return str: The URL for the converted GroupMe image
         """
-        with httpx.Client() as client:
-            res = client.get(image_url)
-            res.raise_for_status()
-            headers = {
-                'X-Access-Token': self.groupme_api_token,
-                'Content-Type': res.headers['Content-type'],
-            }
-            res = client.post(
-                'https://image.groupme.com/pictures',
-                headers=headers,
-                content=res.content
-            )
-            res.raise_for_status()
-            res = res.json()
-            return res['payload']['picture_url']
+        client = http_client()
+        res = client.get(image_url)
+        res.raise_for_status()
+        headers = {
+            'X-Access-Token': self.groupme_api_token,
+            'Content-Type': res.headers['Content-type'],
+        }
+        res = api_request(
+            'pictures',
+            'POST',
+            'https://image.groupme.com/pictures',
+            headers=headers,
+            content=res.content
+        )
+        res.raise_for_status()
+        res = res.json()
+        return res['payload']['picture_url']
 
     def get_group(self, group_id: str) -> dict:
         """
         Get a summary of the group from the GroupMe API
         :return dict:
         """
-        return self.__get(f'/groups/{group_id}')
+        return self.__get('groups', f'/groups/{group_id}')
 
-    def __get(self, path: str) -> dict:
-        res = httpx.get(
+    def __get(self, endpoint: str, path: str) -> dict:
+        res = api_request(
+            endpoint,
+            'GET',
             f'https://api.groupme.com/v3{path}',
             params={'token': self.groupme_api_token}
         )
@@ -0,0 +1,329 @@
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple, Union
+
+from .circuit_breaker import CircuitOpenError
+from .groupme import api_request
+
+logger = logging.getLogger(__name__)
+
+_schema = (
+    'CREATE TABLE IF NOT EXISTS outbox ('
+    ' id INTEGER PRIMARY KEY AUTOINCREMENT,'
+    ' ticket TEXT NOT NULL UNIQUE,'
+    ' bot_id TEXT NOT NULL,'
+    ' payload TEXT NOT NULL,'
+    ' created_at REAL NOT NULL)',
+    'CREATE INDEX IF NOT EXISTS outbox_bot_id ON outbox (bot_id, id)',
+    'CREATE TABLE IF NOT EXISTS outbox_dropped ('
+    ' ticket TEXT PRIMARY KEY,'
+    ' bot_id TEXT NOT NULL,'
+    ' status_code INTEGER NOT NULL,'
+    ' dropped_at REAL NOT NULL)',
+)
+
+# status codes for which a message is kept in the outbox and retried later
+_retry_status_codes = (420, 429)
+
+# results of sending a single message
+_SENT = 'sent'
+_RETRY = 'retry'
+
+PENDING = 'pending'
+DELIVERED = 'delivered'
+DROPPED = 'dropped'
+
+
+class Outbox(object):
+    __slots__ = ('path', 'batch_size', 'poll_interval', 'retry_delay', '_lock', '_conn', '_executor', '_buffer',
+                 '_draining', '_retry_at', '_task', '_loop', '_wakeup')
+
+    def __init__(self, path: str, batch_size: int = 100, poll_interval: float = 0.1, retry_delay: float = 5.0):
+        """
+        A durable queue of outbound bot messages stored in a local SQLite database. Messages are enqueued without
+        blocking on the GroupMe API and are sent by a background task, which is started and stopped with the
+        Application. Messages for a single bot are sent in order, messages for different bots are sent concurrently.
+        A message is only removed from the outbox once GroupMe has accepted it, so messages that could not be sent
+        during an outage are retried, including after a restart. Messages GroupMe rejects with a client error other
+        than rate limiting are dropped and their tickets recorded, see `ticket_status`.
+
+        All database access happens on a single dedicated thread, so neither the event loop nor the threads calling
+        `enqueue` wait on disk I/O. Enqueued messages are written to the database in batches, at the latest every
+        `poll_interval` seconds.
+        :param path: The path of the SQLite database file
+        :param batch_size: The maximum number of messages written or read in one transaction
+        :param poll_interval: Seconds between checks for new messages
+        :param retry_delay: Seconds to wait before retrying a bot after a failed send
+        """
+        self.path = path
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.retry_delay = retry_delay
+
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._buffer: List[Tuple[str, str, str, float]] = []
+        self._draining: Set[str] = set()
+        self._retry_at: Dict[str, float] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+
+    @property
+    def pending(self) -> int:
+        """
+        The number of messages waiting to be sent. Waits on the database thread.
+        :return int:
+        """
+        return self._call(self._count)
+
+    def enqueue(self, bot_id: str, payload: dict) -> str:
+        """
+        Adds a message to the outbox
+        :param str bot_id: The Bot ID provided by GroupMe
+        :param dict payload: The JSON body to POST to the bots/post endpoint
+        :return str: A ticket identifying the message
+        """
+        ticket = uuid.uuid4().hex
+        with self._lock:
+            self._buffer.append((ticket, bot_id, json.dumps(payload), time.time()))
+            full = len(self._buffer) >= self.batch_size
+        if full:
+            self._db_executor.submit(self._flush)
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+        return ticket
+
+    def ticket_status(self, ticket: str) -> str:
+        """
+        The status of the message for a ticket: `pending` while it waits to be sent, `dropped` if GroupMe rejected
+        it, and `delivered` otherwise. Waits on the database thread.
+        :param str ticket: The ticket returned by `enqueue`
+        :return str:
+        """
+        return self._call(self._ticket_status, ticket)
+
+    def is_pending(self, ticket: str) -> bool:
+        """
+        Whether the message for a ticket is still waiting to be sent. Waits on the database thread.
+        :param str ticket: The ticket returned by `enqueue`
+        :return bool:
+        """
+        return self.ticket_status(ticket) == PENDING
+
+    def flush(self) -> None:
+        """
+        Writes all buffered messages to the database. Waits on the database thread.
+        """
+        self._call(self._flush)
+
+    def start(self) -> None:
+        """
+        Starts the background sender on the running event loop
+        """
+        if self._task is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._task = self._loop.create_task(self._run())
+
+    async def stop(self) -> None:
+        """
+        Stops the background sender, writes any buffered messages and closes the database
+        """
+        try:
+            if self._task is not None:
+                self._task.cancel()
+                try:
+                    await self._task
+                except asyncio.CancelledError:
+                    pass
+                except Exception:
+                    logger.exception('outbox sender for `%s` failed', self.path)
+        finally:
+            self._task = None
+            self._loop = None
+            # always write buffered messages, even if the sender failed
+            await self._db(self._close)
+            self._shutdown_executor()
+
+    def close(self) -> None:
+        """
+        Writes any buffered messages and closes the database without waiting on the background sender. Used when
+        the event loop is no longer running, such as at interpreter exit.
+        """
+        if self._task is not None:
+            self._task.cancel()
+        self._task = None
+        self._loop = None
+        self._call(self._close)
+        self._shutdown_executor()
+
+    def _shutdown_executor(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+    @property
+    def _db_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='groupme-outbox')
+            return self._executor
+
+    def _call(self, func: Callable[..., Any], *args) -> Any:
+        return self._db_executor.submit(func, *args).result()
+
+    async def _db(self, func: Callable[..., Any], *args) -> Any:
+        return await asyncio.get_running_loop().run_in_executor(self._db_executor, func, *args)
+
+    # the methods below only run on the database thread
+
+    @property
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            for statement in _schema:
+                conn.execute(statement)
+            self._conn = conn
+        return self._conn
+
+    def _close(self) -> None:
+        self._flush()
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def _flush(self) -> None:
+        with self._lock:
+            buffer, self._buffer = self._buffer, []
+        if not buffer:
+            return
+        conn = self._connection
+        conn.execute('BEGIN')
+        conn.executemany('INSERT INTO outbox (ticket, bot_id, payload, created_at) VALUES (?, ?, ?, ?)', buffer)
+        conn.execute('COMMIT')
+
+    def _count(self) -> int:
+        with self._lock:
+            buffered = len(self._buffer)
+        return self._connection.execute('SELECT COUNT(*) FROM outbox').fetchone()[0] + buffered
+
+    def _ticket_status(self, ticket: str) -> str:
+        with self._lock:
+            if any(item[0] == ticket for item in self._buffer):
+                return PENDING
+        conn = self._connection
+        if conn.execute('SELECT 1 FROM outbox WHERE ticket = ?', (ticket,)).fetchone() is not None:
+            return PENDING
+        if conn.execute('SELECT 1 FROM outbox_dropped WHERE ticket = ?', (ticket,)).fetchone() is not None:
+            return DROPPED
+        return DELIVERED
+
+    def _pending_bot_ids(self) -> List[str]:
+        self._flush()
+        return [row[0] for row in self._connection.execute('SELECT DISTINCT bot_id FROM outbox')]
+
+    def _next_batch(self, bot_id: str) -> List[Tuple[int, str, str]]:
+        return self._connection.execute(
+            'SELECT id, ticket, payload FROM outbox WHERE bot_id = ? ORDER BY id LIMIT ?', (bot_id, self.batch_size)
+        ).fetchall()
+
+    def _acknowledge(self, bot_id: str, row_id: int, ticket: str, status_code: Optional[int]) -> None:
+        conn = self._connection
+        conn.execute('BEGIN')
+        conn.execute('DELETE FROM outbox WHERE id = ?', (row_id,))
+        if status_code is not None:
+            conn.execute(
+                'INSERT OR REPLACE INTO outbox_dropped (ticket, bot_id, status_code, dropped_at) VALUES (?, ?, ?, ?)',
+                (ticket, bot_id, status_code, time.time())
+            )
+        conn.execute('COMMIT')
+
+    # the methods below run on the event loop
+
+    async def _run(self) -> None:
+        drains: Set[asyncio.Task] = set()
+        try:
+            while True:
+                self._wakeup.clear()
+                try:
+                    bot_ids = await self._db(self._pending_bot_ids)
+                except Exception:
+                    # keep polling, the database may only be busy or locked for a moment
+                    logger.exception('outbox failed to read pending messages from `%s`', self.path)
+                    bot_ids = []
+                now = time.monotonic()
+                for bot_id in bot_ids:
+                    if bot_id in self._draining or self._retry_at.get(bot_id, 0) > now:
+                        continue
+                    self._draining.add(bot_id)
+                    task = asyncio.create_task(self._drain(bot_id))
+                    drains.add(task)
+                    task.add_done_callback(drains.discard)
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            for task in list(drains):
+                task.cancel()
+            if drains:
+                await asyncio.gather(*drains, return_exceptions=True)
+
+    async def _drain(self, bot_id: str) -> None:
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                rows = await self._db(self._next_batch, bot_id)
+                if not rows:
+                    return
+                for row_id, ticket, payload in rows:
+                    result = await loop.run_in_executor(None, self._send, bot_id, payload)
+                    if result == _RETRY:
+                        self._retry_at[bot_id] = time.monotonic() + self.retry_delay
+                        return
+                    # delete each message as soon as GroupMe accepts it, so a crash does not post it twice
+                    await self._db(self._acknowledge, bot_id, row_id, ticket, None if result == _SENT else result)
+        except Exception:
+            logger.exception('outbox failed to send messages for bot `%s`', bot_id)
+            self._retry_at[bot_id] = time.monotonic() + self.retry_delay
+        finally:
+            self._draining.discard(bot_id)
+
+    @staticmethod
+    def _send(bot_id: str, payload: str) -> Union[str, int]:
+        """
+        Sends a single message. Returns `sent`, `retry` if it should be retried later, or the status code of a
+        response that means the message will never be accepted.
+        """
+        import httpx
+        try:
+            response = api_request(
+                'bots/post',
+                'POST',
+                'https://api.groupme.com/v3/bots/post',
+                content=payload,
+                headers={'Content-Type': 'application/json'}
+            )
+        except (CircuitOpenError, httpx.TransportError) as e:
+            logger.info('outbox send for bot `%s` deferred: %s', bot_id, e)
+            return _RETRY
+        if response.status_code >= 500 or response.status_code in _retry_status_codes:
+            logger.info('outbox send for bot `%s` deferred: status %s', bot_id, response.status_code)
+            return _RETRY
+        if response.status_code >= 400:
+            # the message will never be accepted, drop it so it does not block the messages behind it
+            logger.warning('outbox dropped message for bot `%s`: status %s', bot_id, response.status_code)
+            return response.status_code
+        return _SENT
@@ -1,4 +1,6 @@
+import asyncio
 from unittest import TestCase
+from unittest.mock import patch
 
 from ..bot import Bot
 from ..application import Application, RouteExistsError
@@ -20,3 +22,47 @@ class TestRouter(TestCase):
         app.add_bot(bot, "/bot")
         self.assertEqual(list(app.routes.keys()), ['/', '/_health', '/bot'])
         self.assertIsInstance(app.routes['/bot']['POST'], Bot)
+
+    def test_lifespan(self):
+        app = Application(warm_up=False)
+        bot = Bot("", "", "", "")
+        bot.add_cron_job(lambda ctx: None, minute=0)
+        app.add_bot(bot, "/bot")
+        self.assertFalse(app.scheduler.running)
+
+        messages = [{'type': 'lifespan.startup'}, {'type': 'lifespan.shutdown'}]
+        sent = []
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            if message['type'] == 'lifespan.startup.complete':
+                self.assertTrue(app.scheduler.running)
+            sent.append(message['type'])
+
+        async def run():
+            await app({'type': 'lifespan'}, receive, send)
+            await asyncio.sleep(0)  # allow the scheduler to process the shutdown
+
+        asyncio.run(run())
+        self.assertEqual(sent, ['lifespan.startup.complete', 'lifespan.shutdown.complete'])
+        self.assertFalse(app.scheduler.running)
+
+    def test_warm_up(self):
+        app = Application(warm_up_timeout=1)
+        bot = Bot("", "", "", "group")
+        failing = Bot("", "", "", "failing-group")
+        app.add_bot(bot, "/bot")
+        app.add_bot(failing, "/failing")
+
+        def get_group(group_id):
+            if group_id == 'failing-group':
+                raise Exception('unavailable')
+            return {'members': []}
+
+        with patch.object(Bot, 'get_group', side_effect=get_group) as mock_get_group:
+            asyncio.run(app.startup())
+            self.assertEqual(bot.group(), {'members': []})
+            self.assertEqual(mock_get_group.call_count, 2)
+        asyncio.run(app.shutdown())
@@ -0,0 +1,92 @@
+import asyncio
+import time
+from unittest import TestCase
+from unittest.mock import Mock, patch
+
+from starlette.testclient import TestClient
+
+from ..bot import Bot, Context
+from ..cache import HandlerCache, normalize_text
+from ..callback import Callback
+
+
+def _context(text: str, sender_id: str = 'sender') -> Context:
+    return Context(Bot("", "", "", ""), Callback({'text': text, 'sender_id': sender_id}))
+
+
+class TestHandlerCache(TestCase):
+    def test_normalize_text(self):
+        self.assertEqual(normalize_text('  \\GIF   Cat \n'), '\\gif cat')
+        self.assertEqual(normalize_text(None), '')
+
+    def test_get(self):
+        cache = HandlerCache(ttl=60, maxsize=2)
+        calls = []
+
+        def handler(ctx):
+            calls.append(ctx.callback.text)
+            return 'reply to ' + normalize_text(ctx.callback.text)
+
+        async def run():
+            self.assertEqual(await cache.get(_context('\\gif cat'), handler), 'reply to \\gif cat')
+            self.assertEqual(await cache.get(_context('\\GIF  cat'), handler), 'reply to \\gif cat')
+            await cache.get(_context('\\gif dog'), handler)
+            await cache.get(_context('\\gif fish'), handler)
+            await cache.get(_context('\\gif cat'), handler)
+
+        asyncio.run(run())
+        self.assertEqual(len(calls), 4)
+        self.assertEqual(cache.stats, {'hits': 1, 'misses': 4, 'collapsed': 0, 'evictions': 2, 'size': 2})
+
+    def test_ttl_and_key(self):
+        cache = HandlerCache(ttl=0.01, key=lambda ctx: ctx.callback.sender_id)
+        calls = []
+
+        def handler(ctx):
+            calls.append(ctx)
+
+        async def run():
+            await cache.get(_context('\\gif cat', 'a'), handler)
+            await cache.get(_context('\\gif cat', 'b'), handler)
+            await cache.get(_context('\\gif cat', 'b'), handler)
+            time.sleep(0.02)
+            await cache.get(_context('\\gif cat', 'b'), handler)
+
+        asyncio.run(run())
+        self.assertEqual(len(calls), 3)
+
+    def test_collapse_concurrent(self):
+        cache = HandlerCache()
+        calls = []
+
+        async def handler(ctx):
+            calls.append(ctx)
+            await asyncio.sleep(0.01)
+            return 'cat.gif'
+
+        async def run():
+            return await asyncio.gather(*(cache.get(_context('\\gif cat'), handler) for _ in range(5)))
+
+        self.assertEqual(asyncio.run(run()), ['cat.gif'] * 5)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(cache.stats['collapsed'], 4)
+
+    def test_cached_handler_callback(self):
+        bot = Bot("", "", "", "")
+        handler = Mock(return_value='cat.gif')
+        bot.add_callback_handler(r'^\\gif', handler, cache=HandlerCache())
+        client = TestClient(bot)
+        callback = {'text': '\\gif cat', 'sender_type': 'user'}
+
+        with patch.object(Bot, 'post_message') as post_message:
+            self.assertEqual(client.post('/', json=callback).status_code, 200)
+            self.assertEqual(client.post('/', json=callback).status_code, 200)
+        self.assertEqual(handler.call_count, 1)
+        self.assertEqual(post_message.call_count, 2)
+        post_message.assert_called_with('cat.gif', None)
+        self.assertEqual(bot.cache_stats[r'^\\gif'], {'hits': 1, 'misses': 1, 'collapsed': 0, 'evictions': 0, 'size': 1})
+
+        # with an outbox the reply is enqueued instead of posted
+        bot.outbox = Mock()
+        self.assertEqual(client.post('/', json=callback).status_code, 200)
+        bot.outbox.enqueue.assert_called_once_with('', {'bot_id': '', 'text': 'cat.gif', 'attachments': []})
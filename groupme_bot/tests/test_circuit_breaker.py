@@ -0,0 +1,91 @@
+from unittest import TestCase
+from unittest.mock import Mock, patch
+
+import httpx
+from starlette.testclient import TestClient
+
+from ..application import Application
+from ..circuit_breaker import (
+    CircuitBreaker, CircuitOpenError, CLOSED, OPEN, HALF_OPEN, configure_circuit_breakers, get_circuit_breaker
+)
+from ..groupme import api_request
+
+
+class TestCircuitBreaker(TestCase):
+    def test_opens_on_failure_rate(self):
+        breaker = CircuitBreaker('test', failure_rate=0.5, window=4, min_calls=4, reset_timeout=60)
+        for success in (True, False, True):
+            breaker.before_call()
+            breaker.record_success() if success else breaker.record_failure()
+        self.assertEqual(breaker.state, CLOSED)
+
+        breaker.before_call()
+        breaker.record_failure()
+        self.assertEqual(breaker.state, OPEN)
+        with self.assertRaises(CircuitOpenError):
+            breaker.before_call()
+
+    def test_half_open_probes(self):
+        breaker = CircuitBreaker('test', window=2, min_calls=1, reset_timeout=0, half_open_probes=2)
+        breaker.record_failure()
+        self.assertEqual(breaker.state, HALF_OPEN)
+
+        # a failed probe opens the circuit again
+        breaker.before_call()
+        breaker.record_failure()
+        self.assertEqual(breaker.state, HALF_OPEN)
+
+        # only `half_open_probes` requests are let through
+        breaker.before_call()
+        breaker.before_call()
+        with self.assertRaises(CircuitOpenError):
+            breaker.before_call()
+        breaker.record_success()
+        self.assertEqual(breaker.state, HALF_OPEN)
+        breaker.record_success()
+        self.assertEqual(breaker.state, CLOSED)
+        self.assertEqual(breaker.to_dict(), {'state': CLOSED, 'failure_rate': 0.0, 'calls': 0})
+
+    def test_late_completion_ignored(self):
+        breaker = CircuitBreaker('test', window=2, min_calls=1, reset_timeout=0, half_open_probes=1)
+        slow_call = breaker.before_call()
+        breaker.record_failure()
+        self.assertEqual(breaker.state, HALF_OPEN)
+
+        probe = breaker.before_call()
+        # the call admitted while closed finishing late is not counted as the probe
+        breaker.record_success(slow_call)
+        self.assertEqual(breaker.state, HALF_OPEN)
+        with self.assertRaises(CircuitOpenError):
+            breaker.before_call()
+        breaker.record_success(probe)
+        self.assertEqual(breaker.state, CLOSED)
+
+
+class TestApiRequest(TestCase):
+    def setUp(self):
+        configure_circuit_breakers(window=2, min_calls=1, reset_timeout=0, half_open_probes=1)
+
+    def tearDown(self):
+        configure_circuit_breakers()
+
+    def test_any_error_releases_probe(self):
+        client = Mock()
+        client.request.side_effect = httpx.TransportError('down')
+        with patch('groupme_bot.groupme.http_client', return_value=client):
+            with self.assertRaises(httpx.TransportError):
+                api_request('test', 'GET', 'https://api.groupme.com/v3/test')
+            self.assertEqual(get_circuit_breaker('test').state, HALF_OPEN)
+
+            # errors that are not transport errors are recorded as failures too
+            client.request.side_effect = httpx.TooManyRedirects('redirects')
+            with self.assertRaises(httpx.TooManyRedirects):
+                api_request('test', 'GET', 'https://api.groupme.com/v3/test')
+
+            client.request.side_effect = None
+            client.request.return_value = Mock(status_code=200)
+            api_request('test', 'GET', 'https://api.groupme.com/v3/test')
+        self.assertEqual(get_circuit_breaker('test').state, CLOSED)
+
+        summary = TestClient(Application(warm_up=False)).get('/').json()
+        self.assertEqual(summary['circuit_breakers']['test'], {'state': CLOSED, 'failure_rate': 0.0, 'calls': 0})
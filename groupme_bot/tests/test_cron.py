@@ -0,0 +1,92 @@
+import asyncio
+from datetime import datetime, timezone
+from unittest import TestCase
+
+from apscheduler.triggers.cron import CronTrigger
+
+from ..application import Application
+from ..bot import Bot
+from ..cron import OffsetTrigger, firing_distribution, limit_concurrency, stagger_offset
+
+
+class TestCron(TestCase):
+    def test_stagger_offset(self):
+        offsets = [stagger_offset(f'bot-{i}', 60) for i in range(100)]
+        self.assertEqual(offsets, [stagger_offset(f'bot-{i}', 60) for i in range(100)])
+        self.assertTrue(all(0 <= offset < 60 for offset in offsets))
+        self.assertGreater(len({int(offset) for offset in offsets}), 30)
+
+    def test_offset_trigger(self):
+        trigger = OffsetTrigger(CronTrigger(minute=0, timezone=timezone.utc), 90)
+        now = datetime(2023, 1, 1, 12, 0, 30, tzinfo=timezone.utc)
+        self.assertEqual(trigger.get_next_fire_time(None, now), datetime(2023, 1, 1, 12, 1, 30, tzinfo=timezone.utc))
+        previous = datetime(2023, 1, 1, 12, 1, 30, tzinfo=timezone.utc)
+        self.assertEqual(trigger.get_next_fire_time(previous, previous),
+                         datetime(2023, 1, 1, 13, 1, 30, tzinfo=timezone.utc))
+
+        start = datetime(2023, 1, 1, 12, 0, 0, tzinfo=timezone.utc)
+        self.assertEqual(firing_distribution([trigger, trigger.trigger], start, 7200, 60), {
+            '2023-01-01T12:00:00+00:00': 1,
+            '2023-01-01T12:01:00+00:00': 1,
+            '2023-01-01T13:00:00+00:00': 1,
+            '2023-01-01T13:01:00+00:00': 1,
+        })
+
+    def test_firing_distribution_slots_align(self):
+        trigger = OffsetTrigger(CronTrigger(minute=0, timezone=timezone.utc), 6.54)
+        start = datetime(2023, 1, 1, 12, 59, 59, 324000, tzinfo=timezone.utc)
+        self.assertEqual(firing_distribution([trigger], start, 60), {'2023-01-01T13:00:06+00:00': 1})
+        self.assertEqual(firing_distribution([trigger], start, 60, 5), {'2023-01-01T13:00:05+00:00': 1})
+
+    def test_application_spread(self):
+        app = Application(cron_spread=300)
+        for i in range(50):
+            bot = Bot(f'bot {i}', 'bot-id', '', '')
+            bot.add_cron_job(lambda ctx: None, minute=0, timezone='UTC')
+            app.add_bot(bot, f'/bot{i}')
+        distribution = app.cron_firing_distribution(horizon=3600)
+        self.assertEqual(sum(distribution.values()), 50)
+        self.assertLess(max(distribution.values()), 5)
+
+    def test_application_spread_job_options(self):
+        app = Application(cron_spread=300)
+        bot = Bot('bot', 'bot-id', '', '')
+        bot.add_cron_job(lambda ctx: None, minute=0, timezone='UTC', misfire_grace_time=30, id='job')
+        app.add_bot(bot, '/bot')
+
+        job = app.scheduler.get_job('job')
+        self.assertEqual(job.misfire_grace_time, 30)
+        self.assertIsInstance(job.trigger, CronTrigger)
+
+    def test_application_spread_identical_schedules_only(self):
+        app = Application(cron_spread=300)
+        for i, minute in enumerate((0, 0, 30)):
+            bot = Bot(f'bot {i}', 'bot-id', '', '')
+            bot.add_cron_job(lambda ctx: None, minute=minute, second=0, timezone='UTC',
+                             misfire_grace_time=30, id=f'job-{i}')
+            app.add_bot(bot, f'/bot{i}')
+
+        jobs = {job.id: job for job in app.scheduler.get_jobs()}
+        self.assertEqual(set(jobs), {'job-0', 'job-1', 'job-2'})
+        self.assertEqual(jobs['job-0'].misfire_grace_time, 30)
+        # both jobs sharing a schedule are offset, including the first one added
+        self.assertIsInstance(jobs['job-0'].trigger, OffsetTrigger)
+        self.assertIsInstance(jobs['job-1'].trigger, OffsetTrigger)
+        self.assertIsInstance(jobs['job-2'].trigger, CronTrigger)
+
+    def test_limit_concurrency(self):
+        running = []
+        peak = []
+
+        async def job():
+            running.append(1)
+            peak.append(len(running))
+            await asyncio.sleep(0.01)
+            running.pop()
+
+        async def run():
+            wrapped = limit_concurrency(job, asyncio.Semaphore(2))
+            await asyncio.gather(*(wrapped() for _ in range(6)))
+
+        asyncio.run(run())
+        self.assertEqual(max(peak), 2)
@@ -0,0 +1,184 @@
+import asyncio
+import json
+import os
+import sqlite3
+import tempfile
+from unittest import TestCase
+from unittest.mock import patch, Mock
+
+import httpx
+
+from ..application import Application
+from ..bot import Bot
+from ..outbox import Outbox, DELIVERED, DROPPED, PENDING
+
+
+async def _wait_until_sent(outbox: Outbox):
+    for _ in range(200):
+        if not outbox.pending:
+            return
+        await asyncio.sleep(0.01)
+
+
+class TestOutbox(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, 'outbox.db')
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_enqueue_survives_restart(self):
+        outbox = Outbox(self.path)
+        bot = Bot("", "bot-id", "", "", outbox=outbox)
+        ticket = bot.enqueue_message("hello")
+        self.assertTrue(outbox.is_pending(ticket))
+        asyncio.run(outbox.stop())
+
+        outbox = Outbox(self.path)
+        self.assertEqual(outbox.pending, 1)
+        self.assertTrue(outbox.is_pending(ticket))
+        asyncio.run(outbox.stop())
+
+    def test_sends_in_order_and_retries(self):
+        outbox = Outbox(self.path, poll_interval=0.01, retry_delay=0.01)
+        bot = Bot("", "bot-id", "", "", outbox=outbox)
+        sent = []
+        statuses = [503, 200, 200, 200]
+
+        def api_request(endpoint, method, url, content, headers):
+            status = statuses.pop(0)
+            if status == 200:
+                sent.append(json.loads(content)['text'])
+            return Mock(status_code=status)
+
+        async def run():
+            tickets = [bot.enqueue_message(str(i)) for i in range(3)]
+            outbox.start()
+            for _ in range(200):
+                if not outbox.pending:
+                    break
+                await asyncio.sleep(0.01)
+            await outbox.stop()
+            return tickets
+
+        with patch('groupme_bot.outbox.api_request', side_effect=api_request):
+            tickets = asyncio.run(run())
+        self.assertEqual(sent, ['0', '1', '2'])
+        outbox = Outbox(self.path)
+        self.assertFalse(any(outbox.is_pending(ticket) for ticket in tickets))
+        asyncio.run(outbox.stop())
+
+    def test_ticket_status(self):
+        outbox = Outbox(self.path, poll_interval=0.01)
+        bot = Bot("", "bot-id", "", "", outbox=outbox)
+
+        def api_request(endpoint, method, url, content, headers):
+            return Mock(status_code=400 if json.loads(content)['text'] == 'rejected' else 200)
+
+        async def run():
+            tickets = [bot.enqueue_message('rejected'), bot.enqueue_message('accepted')]
+            self.assertEqual(outbox.ticket_status(tickets[0]), PENDING)
+            outbox.start()
+            for _ in range(200):
+                if not outbox.pending:
+                    break
+                await asyncio.sleep(0.01)
+            statuses = [outbox.ticket_status(ticket) for ticket in tickets]
+            await outbox.stop()
+            return statuses
+
+        with patch('groupme_bot.outbox.api_request', side_effect=api_request):
+            self.assertEqual(asyncio.run(run()), [DROPPED, DELIVERED])
+
+    def test_acknowledges_each_message(self):
+        outbox = Outbox(self.path, poll_interval=0.01)
+        bot = Bot("", "bot-id", "", "", outbox=outbox)
+        pending_at_send = []
+
+        def api_request(endpoint, method, url, content, headers):
+            # runs in the default executor, so waiting on the database thread is fine here
+            pending_at_send.append(outbox.pending)
+            return Mock(status_code=200)
+
+        async def run():
+            for i in range(3):
+                bot.enqueue_message(str(i))
+            outbox.start()
+            await _wait_until_sent(outbox)
+            await outbox.stop()
+
+        with patch('groupme_bot.outbox.api_request', side_effect=api_request):
+            asyncio.run(run())
+        self.assertEqual(pending_at_send, [3, 2, 1])
+
+    def test_sender_survives_database_errors(self):
+        outbox = Outbox(self.path, poll_interval=0.01)
+        bot = Bot("", "bot-id", "", "", outbox=outbox)
+        pending_bot_ids = Outbox._pending_bot_ids
+        errors = [sqlite3.OperationalError('database is locked')]
+
+        def flaky_pending_bot_ids(self):
+            if errors:
+                raise errors.pop()
+            return pending_bot_ids(self)
+
+        async def run():
+            bot.enqueue_message('hello')
+            outbox.start()
+            await _wait_until_sent(outbox)
+            await outbox.stop()
+
+        with patch.object(Outbox, '_pending_bot_ids', autospec=True, side_effect=flaky_pending_bot_ids), \
+                patch('groupme_bot.outbox.api_request', return_value=Mock(status_code=200)) as api_request:
+            with self.assertLogs('groupme_bot.outbox', 'ERROR'):
+                asyncio.run(run())
+        self.assertEqual(api_request.call_count, 1)
+
+    def test_stop_flushes_after_sender_failure(self):
+        outbox = Outbox(self.path)
+
+        async def failing_run(self):
+            raise RuntimeError('sender failed')
+
+        async def run():
+            with patch.object(Outbox, '_run', autospec=True, side_effect=failing_run):
+                outbox.start()
+            await asyncio.sleep(0)
+            outbox.enqueue('bot-id', {'text': 'hello'})
+            with self.assertLogs('groupme_bot.outbox', 'ERROR'):
+                await outbox.stop()
+
+        asyncio.run(run())
+        outbox = Outbox(self.path)
+        self.assertEqual(outbox.pending, 1)
+        outbox.close()
+
+    def test_started_without_lifespan_and_after_startup(self):
+        app = Application(warm_up=False, outbox=Outbox(self.path, poll_interval=0.01))
+        late_outbox = Outbox(os.path.join(self.tmp_dir.name, 'late.db'), poll_interval=0.01)
+        bot = Bot("", "bot-id", "", "")
+        late_bot = Bot("", "late-bot-id", "", "", outbox=late_outbox)
+        for b in (bot, late_bot):
+            b.add_callback_handler(r'^\\hello', lambda ctx: ctx.bot.enqueue_message('hello'))
+        app.add_bot(bot, '/bot')
+        callback = {'text': '\\hello', 'sender_type': 'user'}
+
+        async def run():
+            # httpx's ASGI transport does not send lifespan events
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app), base_url='http://test') as client:
+                self.assertEqual((await client.post('/bot', json=callback)).status_code, 200)
+                app.add_bot(late_bot, '/late')
+                await asyncio.sleep(0)
+                self.assertEqual((await client.post('/late', json=callback)).status_code, 200)
+            for outbox in app.outboxes:
+                await _wait_until_sent(outbox)
+            pending = [outbox.pending for outbox in app.outboxes]
+            await app.shutdown()
+            return pending
+
+        with patch('groupme_bot.outbox.api_request', return_value=Mock(status_code=200)) as api_request, \
+                patch('atexit.register') as atexit_register:
+            self.assertEqual(asyncio.run(run()), [0, 0])
+        self.assertEqual(api_request.call_count, 2)
+        atexit_register.assert_called_once_with(app._stop_background)
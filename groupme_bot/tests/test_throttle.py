@@ -0,0 +1,63 @@
+from unittest import TestCase
+from unittest.mock import Mock
+
+from starlette.testclient import TestClient
+
+from ..bot import Bot
+from ..callback import Callback
+from ..throttle import Throttle, TokenBuckets
+
+
+class TestThrottle(TestCase):
+    def test_token_buckets(self):
+        buckets = TokenBuckets(rate=0, burst=2, max_keys=2)
+        self.assertTrue(buckets.take('a'))
+        self.assertTrue(buckets.take('a'))
+        self.assertFalse(buckets.take('a'))
+
+        # the least recently used key is evicted and starts over with a full bucket
+        self.assertTrue(buckets.take('b'))
+        self.assertTrue(buckets.take('c'))
+        self.assertEqual(len(buckets), 2)
+        self.assertTrue(buckets.take('a'))
+
+    def test_admit(self):
+        throttle = Throttle(sender_rate=0, sender_burst=1, group_rate=0, group_burst=2)
+        self.assertTrue(throttle.admit('sender-1', 'group'))
+        self.assertFalse(throttle.admit('sender-1', 'group'))
+        self.assertTrue(throttle.admit('sender-2', 'group'))
+        self.assertFalse(throttle.admit('sender-3', 'group'))
+        self.assertEqual(throttle.stats, {'admitted': 2, 'throttled_sender': 1, 'throttled_group': 1})
+
+    def test_group_rejection_keeps_sender_token(self):
+        throttle = Throttle(sender_rate=0, sender_burst=1, group_rate=0, group_burst=1)
+        self.assertTrue(throttle.admit('sender-1', 'group-1'))
+        self.assertFalse(throttle.admit('sender-2', 'group-1'))
+        # the message rejected by the group limit did not use the sender's token
+        self.assertTrue(throttle.admit('sender-2', 'group-2'))
+
+    def test_throttled_callback(self):
+        bot = Bot("", "", "", "", throttle=Throttle(sender_rate=0, sender_burst=1))
+        handler = Mock()
+        bot.add_callback_handler(r'^\\all', handler)
+        client = TestClient(bot)
+        callback = {'text': '\\all', 'sender_type': 'user', 'sender_id': 'sender', 'group_id': 'group'}
+
+        self.assertEqual(client.post('/', json=callback).status_code, 200)
+        response = client.post('/', json=callback)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.text, 'Success')
+        self.assertEqual(handler.call_count, 1)
+        self.assertEqual(bot.stats, {'throttled': 1, 'cooldown': 0})
+
+    def test_handler_cooldown(self):
+        bot = Bot("", "", "", "", throttle=Throttle(sender_rate=0, sender_burst=2))
+        bot.add_callback_handler(r'^\\all', lambda ctx: None, cooldown=60)
+        bot.add_callback_handler(r'^\\gif', lambda ctx: None)
+        callback = Callback({'sender_id': 'sender', 'group_id': 'group'})
+
+        self.assertTrue(bot._admit(r'^\\all', callback))
+        self.assertFalse(bot._admit(r'^\\all', callback))
+        self.assertTrue(bot._admit(r'^\\gif', callback))
+        self.assertFalse(bot._admit(r'^\\gif', callback))
+        self.assertEqual(bot.stats, {'throttled': 1, 'cooldown': 1})
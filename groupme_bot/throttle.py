@@ -0,0 +1,111 @@
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+
+class TokenBuckets(object):
+    __slots__ = ('rate', 'burst', 'max_keys', '_buckets')
+
+    def __init__(self, rate: float, burst: int, max_keys: int = 100_000):
+        """
+        A set of token buckets, one per key. Each bucket holds up to `burst` tokens and is refilled at `rate` tokens
+        per second. Only the `max_keys` most recently used buckets are kept, a key that was evicted starts again
+        with a full bucket.
+        :param rate: Tokens added to each bucket per second
+        :param burst: The maximum number of tokens in a bucket
+        :param max_keys: The maximum number of buckets kept in memory
+        """
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets: OrderedDict[str, Tuple[float, float]] = OrderedDict()
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def available(self, key: str) -> bool:
+        """
+        Whether the bucket of the key has a token, without taking it
+        :param str key: The bucket key
+        :return bool:
+        """
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            return self.burst >= 1
+        tokens, updated_at = bucket
+        return min(self.burst, tokens + (time.monotonic() - updated_at) * self.rate) >= 1
+
+    def take(self, key: str) -> bool:
+        """
+        Takes a token from the bucket of the key
+        :param str key: The bucket key
+        :return bool: True if a token was available
+        """
+        now = time.monotonic()
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            tokens = self.burst
+            if len(self._buckets) >= self.max_keys:
+                self._buckets.popitem(last=False)
+        else:
+            tokens, updated_at = bucket
+            tokens = min(self.burst, tokens + (now - updated_at) * self.rate)
+            self._buckets.move_to_end(key)
+        if tokens < 1:
+            self._buckets[key] = (tokens, now)
+            return False
+        self._buckets[key] = (tokens - 1, now)
+        return True
+
+
+class Throttle(object):
+    __slots__ = ('_senders', '_groups', '_stats')
+
+    def __init__(self, sender_rate: Optional[float] = None, sender_burst: int = 5, group_rate: Optional[float] = None,
+                 group_burst: int = 20, max_keys: int = 100_000):
+        """
+        Inbound admission control for callbacks. Limits how often a single sender, and a single group, can trigger
+        callback handlers. Throttled callbacks are answered with a 200 without running the handler.
+        :param sender_rate: Handler calls per second allowed for each sender, None for no limit
+        :param sender_burst: The number of handler calls a sender can make in a burst
+        :param group_rate: Handler calls per second allowed for each group, None for no limit
+        :param group_burst: The number of handler calls a group can make in a burst
+        :param max_keys: The maximum number of senders, and of groups, tracked in memory
+        """
+        self._senders: Optional[TokenBuckets] = None
+        self._groups: Optional[TokenBuckets] = None
+        if sender_rate is not None:
+            self._senders = TokenBuckets(sender_rate, sender_burst, max_keys)
+        if group_rate is not None:
+            self._groups = TokenBuckets(group_rate, group_burst, max_keys)
+        self._stats: Dict[str, int] = {'admitted': 0, 'throttled_sender': 0, 'throttled_group': 0}
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        """
+        Counts of admitted and throttled callbacks
+        :return dict:
+        """
+        return dict(self._stats)
+
+    def admit(self, sender_id: str, group_id: str) -> bool:
+        """
+        Whether a callback from the sender in the group may run its handler
+        :param str sender_id: The id of the sender of the message
+        :param str group_id: The id of the group the message was sent to
+        :return bool:
+        """
+        sender_id, group_id = str(sender_id), str(group_id)
+        # check both limits before taking a token from either, so a rejected callback costs nothing
+        if self._senders is not None and not self._senders.available(sender_id):
+            self._stats['throttled_sender'] += 1
+            return False
+        if self._groups is not None and not self._groups.available(group_id):
+            self._stats['throttled_group'] += 1
+            return False
+        if self._senders is not None:
+            self._senders.take(sender_id)
+        if self._groups is not None:
+            self._groups.take(group_id)
+        self._stats['admitted'] += 1
+        return True